@@ -0,0 +1,160 @@
+"""
+In-process cache for upstream API responses keyed by image hash
+"""
+import asyncio
+import hashlib
+import io
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, BinaryIO, Callable, Union
+
+from PIL import Image
+
+# Responses for the same image don't change, so keep them for a day
+CACHE_TTL_SECONDS = int(os.getenv("SCAN_CACHE_TTL_SECONDS", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("SCAN_CACHE_MAX_ENTRIES", "512"))
+UPLOAD_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "max_size": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_responses = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+_inflight = {}
+# Callers currently awaiting each in-flight fetch task
+_waiters = {}
+
+# Finished scan results keyed by the raw upload, so a retried upload skips compression too
+scan_results = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+
+def content_hasher():
+    """Incremental hasher matching image_cache_key, for hashing bytes as they arrive"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def image_cache_key(image_data: bytes) -> str:
+    """Content hash used to key cached responses for an image"""
+    return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def upload_content_key(image_source: Union[bytes, BinaryIO]) -> str:
+    """Content hash of raw upload bytes, or of a seekable file read in chunks"""
+    if isinstance(image_source, bytes):
+        return image_cache_key(image_source)
+    digest = content_hasher()
+    image_source.seek(0)
+    while chunk := image_source.read(UPLOAD_HASH_CHUNK_BYTES):
+        digest.update(chunk)
+    image_source.seek(0)
+    return digest.hexdigest()
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for this worker's caches"""
+    return {
+        "responses": _responses.stats(),
+        "scan_results": scan_results.stats(),
+        "inflight": len(_inflight),
+    }
+
+
+# Side of the difference-hash grid: 16x16 gradient signs -> 256-bit key
+DHASH_SIZE = 16
+
+
+def perceptual_image_key(image_data: bytes) -> str:
+    """
+    Difference hash of the image so re-encodes of the same photo (different JPEG
+    quality, metadata stripped) share cached responses. Falls back to the content hash.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        # JPEGs decode straight at 1/8 scale - the hash only needs a thumbnail
+        img.draft('L', (DHASH_SIZE * 4, DHASH_SIZE * 4))
+        pixels = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BOX).tobytes()
+
+        bits = 0
+        for row in range(DHASH_SIZE):
+            offset = row * (DHASH_SIZE + 1)
+            for col in range(DHASH_SIZE):
+                bits = (bits << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+        return f"dhash:{bits:064x}"
+    except Exception as e:
+        print(f"⚠️ Perceptual hash failed, using content hash: {str(e)}")
+        return image_cache_key(image_data)
+
+
+async def get_or_fetch(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Return the cached value for `key`, otherwise await `fetch()` and cache its result.
+    Concurrent callers with the same key share one in-flight fetch; failures are not cached.
+    The fetch is cancelled only when every caller waiting on it has been cancelled.
+    """
+    cached = _responses.get(key)
+    if cached is not None:
+        print(f"⚡ Cache hit: {key}")
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch())
+        _inflight[key] = task
+
+        def _store(done: asyncio.Task) -> None:
+            _inflight.pop(key, None)
+            if not done.cancelled() and done.exception() is None:
+                _responses.set(key, done.result())
+
+        task.add_done_callback(_store)
+    else:
+        print(f"🔗 Joining in-flight request: {key}")
+
+    # Shield so one caller going away doesn't cancel the fetch for the others
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Last interested caller gone - stop the upstream call instead of spending quota on it
+        if _waiters[task] == 1 and not task.done():
+            task.cancel()
+        raise
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
@@ -1,5 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
+import anyio.to_thread
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List
 import os
@@ -22,9 +24,27 @@ Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title="PlantPal API",
     description="Plant identification and care tracking API.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 ) 
 
+# Registered before CORS so CORS stays outermost and the 413 still carries its headers
+@app.middleware("http")
+async def reject_oversize_scans(request: Request, call_next):
+    """Refuse oversize scan uploads from Content-Length before the body is received"""
+    if request.method == "POST" and request.url.path == "/api/v1/scan":
+        try:
+            content_length = int(request.headers.get("content-length", 0))
+        except ValueError:
+            content_length = 0
+        if content_length > scan.MAX_SCAN_REQUEST_BYTES:
+            print(f"❌ Scan upload rejected: Content-Length {content_length} bytes")
+            return ORJSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": "Image file too large (max 10MB)"}
+            )
+    return await call_next(request)
+
 # CORS configuration
 origins = os.getenv(
     "CORS_ORIGINS", 
@@ -44,6 +64,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def configure_threadpool():
+    """Raise anyio's worker-thread limit (default 40) used for sync dependencies and upload reads"""
+    thread_limit = int(os.getenv("THREADPOOL_SIZE", "128"))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = thread_limit
+    print(f"🧵 Threadpool size: {thread_limit}")
+
+@app.on_event("shutdown")
+async def close_outbound_sessions():
+    """Close pooled connections to the plant identification APIs"""
+    await scan.close_http_session()
+
 # Include routers
 app.include_router(users.router)
 app.include_router(plants.router)
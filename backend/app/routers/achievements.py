@@ -32,6 +32,21 @@ def get_user_by_cognito_id(cognito_user_id: str, db: Session) -> models.User:
     return user
 
 
+def get_user_id_by_cognito_id(cognito_user_id: str, db: Session) -> str:
+    """Get user id by cognito_user_id, raise 404 if not found"""
+    # Only select the id column - no need to hydrate the full User entity
+    row = db.query(models.User.id).filter(
+        models.User.cognito_user_id == cognito_user_id
+    ).first()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return row.id
+
+
 def initialize_user_achievements(user_id: str, db: Session) -> None:
     """
     Initialize all active achievements for a new user.
@@ -5,10 +5,12 @@ WARNING: These endpoints should be protected and used with caution
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
 from sqlalchemy import text 
+import os
 
 from app.database import get_db
 from app import models
 from app.auth import get_current_user_info
+from app.cache import cache_stats
 
 router = APIRouter(prefix="/api/v1/admin", tags=["admin"])
 
@@ -181,6 +183,22 @@ def list_tables(
         )
 
 
+@router.get("/cache-stats")
+def get_cache_stats(
+    user_info: dict = Depends(get_current_user_info)
+):
+    """
+    Hit/miss counters for the scan and care-recommendation caches.
+    The caches live in each worker process, so these stats cover only the
+    worker that served this request (identified by worker_pid)
+    """
+    return {
+        "success": True,
+        "worker_pid": os.getpid(),
+        "caches": cache_stats()
+    }
+
+
 @router.post("/seed-achievements")
 def seed_achievements(
     user_info: dict = Depends(get_current_user_info),
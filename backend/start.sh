@@ -16,5 +16,10 @@ else
 fi
 
 # Start the FastAPI server
-echo "🌱 Starting FastAPI server..."
-uvicorn app.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+# Multiple workers let overlapping scans (multipart parsing, image compression)
+# use more than one core. Keep the default modest: the ECS task has 400MB.
+WORKERS="${WEB_CONCURRENCY:-2}"
+# The app splits the upstream rate limits across this many worker processes
+export WEB_CONCURRENCY="${WORKERS}"
+echo "🌱 Starting FastAPI server with ${WORKERS} worker(s)..."
+uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "${WORKERS}" --timeout-keep-alive 60
\ No newline at end of file